@@ -1,48 +1,126 @@
 from __future__ import annotations
 
+import gzip
+import hashlib
+import os
+import re
+import threading
 import time
 import logging
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
-from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
 import urllib3
 
+from .storage import write_frame
+
 logger = logging.getLogger("nbastats")
 
+# One pool for the whole process so repeated Basketball Reference requests reuse the same
+# keep-alive connection instead of paying a fresh TCP + TLS handshake per page.
+_HTTP = urllib3.PoolManager(
+    maxsize=16,
+    block=False,
+    headers={"User-Agent": "nbastats/0.1 (personal research scraper)"},
+    retries=urllib3.Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504]),
+)
 
-def get_soup(url: str) -> Tuple[str, List[str]]:
-    """Fetch a URL and return cleaned text + list of href links.
 
-    Note: Basketball Reference pages are HTML; we keep this function small and explicit so it can
-    be swapped out later (requests/session reuse, caching, retries, etc.).
+# Anchored link patterns, e.g. /teams/BOS/2020.html and /boxscores/201910220TOR.html. The season
+# group of _TEAM_RE is None for other team pages (e.g. /teams/BOS/), which still yield the abbrev.
+_TEAM_RE = re.compile(r"^/teams/([A-Z]{3})/(?:(\d{4})\.html$)?")
+_BOX_RE = re.compile(r"^/boxscores/(\d{8}0[A-Z]{3})\.html$")
+
+# Optional on-disk page cache. Historical Basketball Reference pages don't change, so a rerun can
+# be served entirely from disk. Disabled until set_cache_dir() is called.
+_CACHE_DIR: Optional[Path] = None
+
+
+def get_session() -> urllib3.PoolManager:
+    """Return the shared connection pool used for all page fetches."""
+    return _HTTP
+
+
+def set_cache_dir(cache_dir: str | Path | None) -> None:
+    """Enable the on-disk HTML cache under `cache_dir` (None disables it)."""
+    global _CACHE_DIR
+    _CACHE_DIR = Path(cache_dir) if cache_dir is not None else None
+    if _CACHE_DIR is not None:
+        _CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+
+def _cache_path(url: str) -> Optional[Path]:
+    if _CACHE_DIR is None:
+        return None
+    return _CACHE_DIR / f"{hashlib.sha1(url.encode()).hexdigest()}.html.gz"
+
+
+def is_cached(url: str) -> bool:
+    """True if `url` will be served from the on-disk cache (no network request)."""
+    path = _cache_path(url)
+    return path is not None and path.exists()
+
+
+def fetch_html(url: str) -> bytes:
+    """Fetch a URL through the shared connection pool and return the raw response body.
+
+    Successful (200) responses are stored in the on-disk cache when enabled, and served from it
+    on later calls.
     """
+    path = _cache_path(url)
+    if path is not None and path.exists():
+        logger.debug("Cache hit: %s", url)
+        return gzip.decompress(path.read_bytes())
+
     logger.info("Fetching: %s", url)
-    req = urllib3.PoolManager()
-    res = req.request("GET", url)
-    soup = BeautifulSoup(res.data, "html.parser")
+    res = _HTTP.request("GET", url)
+    if path is not None and res.status == 200:
+        # Write-then-rename so concurrent scrapers never see a partial file.
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(gzip.compress(res.data))
+        os.replace(tmp, path)
+    return res.data
+
+
+def parse_soup(html: bytes | str) -> Tuple[str, List[str]]:
+    """Parse already-downloaded HTML and return cleaned text + list of href links.
+
+    Parsing uses selectolax's Lexbor backend: the tree stays in C memory and only the nodes we
+    touch (anchors + body text) are materialized as Python objects.
+    """
+    tree = LexborHTMLParser(html)
 
     # Remove script/style for cleaner text extraction.
-    for script in soup(["script", "style"]):
-        script.extract()
+    tree.strip_tags(["script", "style"])
 
-    text = soup.get_text()
+    root = tree.body if tree.body is not None else tree.root
+    text = root.text(separator="\n") if root is not None else ""
     lines = (line.strip() for line in text.splitlines())
     chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
     text = "\n".join(chunk for chunk in chunks if chunk)
 
     links: List[str] = []
-    for link in soup.find_all("a"):
-        href = link.get("href")
+    for node in tree.css("a"):
+        href = node.attributes.get("href")
         if href:
             links.append(href)
     return text, links
 
 
+def get_soup(url: str) -> Tuple[str, List[str]]:
+    """Fetch a URL and return cleaned text + list of href links.
+
+    Note: Basketball Reference pages are HTML; we keep this function small and explicit so it can
+    be swapped out later (requests/session reuse, caching, retries, etc.).
+    """
+    return parse_soup(fetch_html(url))
+
+
 def get_team_name_abbrevs(out_path: str | Path) -> pd.DataFrame:
-    """Scrape team abbreviations by season and save to a pickle."""
+    """Scrape team abbreviations by season and save them (format follows the out_path suffix)."""
     out_path = Path(out_path)
     out_path.parent.mkdir(parents=True, exist_ok=True)
 
@@ -53,20 +131,15 @@ def get_team_name_abbrevs(out_path: str | Path) -> pd.DataFrame:
 
         teams: List[str] = []
         for link in links:
-            if len(link) > 3:
-                parts = link[1:].split("/")
-                # expected: ['teams', 'BOS', '2020.html']
-                try:
-                    if parts[0] == "teams" and parts[1] and int(parts[2].split(".")[0]) == year:
-                        teams.append(parts[1])
-                except Exception:
-                    continue
+            m = _TEAM_RE.match(link)
+            if m and m.group(2) and int(m.group(2)) == year:
+                teams.append(m.group(1))
 
         teams_by_year[str(year)] = pd.Series(teams).unique().tolist()
 
     df = pd.DataFrame({"Year": list(teams_by_year.keys()),
                        "Teams": [teams_by_year[y] for y in teams_by_year.keys()]})
-    df.to_pickle(out_path)
+    write_frame(df, out_path)
     logger.info("Wrote team abbrevs: %s", out_path)
     return df
 
@@ -93,15 +166,11 @@ def get_dates_of_games(out_path: str | Path,
             if text == "404":
                 continue
 
-            games: List[str] = []
-            for link in links:
-                parts = link[1:].split("/")
-                if len(parts) == 2 and parts[0] == "boxscores" and parts[1].endswith(".html"):
-                    games.append(parts[1].split(".")[0])
+            games = [m.group(1) for m in map(_BOX_RE.match, links) if m]
 
             rows.append({"Year": year, "Month": month, "Games": games})
 
     game_df = pd.DataFrame(rows, columns=["Year", "Month", "Games"])
-    game_df.to_pickle(out_path)
+    write_frame(game_df, out_path)
     logger.info("Wrote games-by-year: %s", out_path)
     return game_df
@@ -1,13 +1,16 @@
 from __future__ import annotations
 
 import logging
-from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
 from pathlib import Path
-from typing import List
+from typing import List, Tuple
 
 import numpy as np
 import pandas as pd
 
+from .parallel import run_per_season
+from .storage import read_frame, write_frame
+
 logger = logging.getLogger("nbastats")
 
 
@@ -21,123 +24,279 @@ def combine_boxscores(boxscores_dir: str | Path, out_path: str | Path) -> Path:
     if not pkls:
         raise FileNotFoundError(f"No year pkls found in {boxscores_dir}")
 
-    df = pd.concat([pd.read_pickle(p) for p in pkls], ignore_index=True)
+    # .copy() gives each year frame its own consolidated blocks, so concat never has to walk
+    # buffers shared with the unpickled objects.
+    frames = [pd.read_pickle(p).copy() for p in pkls]
+    df = _compact_boxscores(pd.concat(frames, ignore_index=True))
     df.to_pickle(out_path)
     logger.info("Wrote combined boxscores: %s (rows=%d)", out_path, len(df))
     return out_path
 
 
-def _build_row(game_idx: int, player: pd.Series, game_player_list: List[pd.DataFrame], home: bool) -> pd.Series:
-    tmp = pd.Series(dtype=object)
-    tmp["gameIdx"] = game_idx
-    tmp["playerIdx"] = player.get("playerIndex", np.nan)
-
-    if home:
-        tmp["home"] = True
-        tmp["team"] = [ii for ii in game_player_list[0].playerIndex.values]
-        tmp["opponent"] = [ii for ii in game_player_list[1].playerIndex.values]
-    else:
-        tmp["home"] = False
-        tmp["team"] = [ii for ii in game_player_list[1].playerIndex.values]
-        tmp["opponent"] = [ii for ii in game_player_list[0].playerIndex.values]
-
-    return pd.concat([tmp, player], axis=0)
-
-
-def _player_data(
-    player: pd.Series,
-    game: pd.Series,
-    home: bool,
-    by_team_name: pd.DataFrame,
-    by_name: pd.DataFrame,
-) -> pd.Series:
-    if home:
-        team = game.Home
-        adv_df = game.Home_Advanced
-    else:
-        team = game.Away
-        adv_df = game.Away_Advanced
-
-    name = player.Starters
-    if name == "Peja StojakoviÄ":
-        name = "Peja Stojaković"
-
-    # Advanced row lookup
-    advanced = adv_df[adv_df.Starters == player.Starters].iloc[:, 2:].iloc[0]
-
-    # Player metadata lookup (FAST)
-    try:
-        info = by_team_name.loc[(team, name)]
-        info_row = info.iloc[0] if isinstance(info, pd.DataFrame) else info
-    except KeyError:
-        try:
-            info = by_name.loc[name]
-            info_row = info.iloc[0] if isinstance(info, pd.DataFrame) else info
-        except KeyError:
-            raise KeyError(f"Could not match player info for name={name} year={game.Season} team={team}")
-
-    basic = player.iloc[1:]
-    return pd.concat([info_row, basic, advanced], axis=0)
-
-def _home_player_data(row: pd.Series, by_team_name: pd.DataFrame, by_name: pd.DataFrame) -> pd.DataFrame:
-    box_score = row.Home_Basic.dropna(subset=["FG"])
-    return box_score.apply(lambda x: _player_data(x, row, True, by_team_name, by_name), axis=1)
-
-def _away_player_data(row: pd.Series, by_team_name: pd.DataFrame, by_name: pd.DataFrame) -> pd.DataFrame:
-    box_score = row.Away_Basic.dropna(subset=["FG"])
-    return box_score.apply(lambda x: _player_data(x, row, False, by_team_name, by_name), axis=1)
-
-def _players_in_game(row: pd.Series, by_team_name: pd.DataFrame, by_name: pd.DataFrame) -> List[pd.DataFrame]:
-    return [
-        _home_player_data(row, by_team_name, by_name),
-        _away_player_data(row, by_team_name, by_name),
-    ]
-
-def _build_player_lookup(all_player_data_year: pd.DataFrame):
-    # Fast lookup by (Team, Name), fallback by Name only
-    by_team_name = all_player_data_year.set_index(["Team", "Name"], drop=False)
-    by_name = all_player_data_year.set_index(["Name"], drop=False)
-    return by_team_name, by_name
+# Scraped name that doesn't match the player metadata spelling.
+_NAME_FIXES = {"Peja StojakoviÄ": "Peja Stojaković"}
+
+ADV_KEYS = ["gameIdx", "home", "Starters"]
+
+# Low-cardinality strings: pandas groups/joins on category codes, and Parquet dictionary-encodes them.
+BOXSCORE_DTYPES = {"Home": "category", "Away": "category", "Month": "category", "Season": "int16"}
+MASTER_CATEGORY_COLS = ["Team", "Name", "Position", "Country", "College"]
+
+
+def _compact_boxscores(df: pd.DataFrame) -> pd.DataFrame:
+    return df.astype({c: t for c, t in BOXSCORE_DTYPES.items() if c in df})
+
+
+def _long_box_scores(year_df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Stack every game's per-team basic/advanced tables into two long frames for the year.
+
+    Each player row is tagged with gameIdx (position of the game within the year), home, and the
+    team abbreviation used for the metadata join. Rows are ordered game by game, home then away.
+    """
+    basic_parts: List[pd.DataFrame] = []
+    adv_parts: List[pd.DataFrame] = []
+    tags: List[Tuple[int, bool, str]] = []
+    # itertuples yields lightweight namedtuples; iterrows would build a Series per game.
+    cols = ["Home", "Away", "Home_Basic", "Home_Advanced", "Away_Basic", "Away_Advanced"]
+    for game_idx, game in enumerate(year_df[cols].itertuples(index=False)):
+        sides = (
+            (True, game.Home, game.Home_Basic, game.Home_Advanced),
+            (False, game.Away, game.Away_Basic, game.Away_Advanced),
+        )
+        for home, team, basic, adv in sides:
+            if not isinstance(basic, pd.DataFrame):
+                logger.warning("No boxscore for game %d (%s vs %s); skipping", game_idx, game.Home, game.Away)
+                continue
+            basic_parts.append(basic)
+            adv_parts.append(adv)
+            tags.append((game_idx, home, team))
+
+    if not basic_parts:
+        return pd.DataFrame(), pd.DataFrame()
+
+    # Tag rows once on the stacked frames instead of assign/dropna per game.
+    game_ids = np.array([t[0] for t in tags])
+    homes = np.array([t[1] for t in tags])
+    teams = np.array([t[2] for t in tags], dtype=object)
+    basic = pd.concat(basic_parts, ignore_index=True)
+    n_basic = [len(p) for p in basic_parts]
+    basic["gameIdx"] = np.repeat(game_ids, n_basic)
+    basic["home"] = np.repeat(homes, n_basic)
+    basic["_team"] = np.repeat(teams, n_basic)
+    basic = basic[basic["FG"].notna()].reset_index(drop=True)
+
+    adv = pd.concat(adv_parts, ignore_index=True)
+    n_adv = [len(p) for p in adv_parts]
+    adv["gameIdx"] = np.repeat(game_ids, n_adv)
+    adv["home"] = np.repeat(homes, n_adv)
+    return basic, adv
+
+
+def _build_player_lookup(all_player_data_year: pd.DataFrame) -> Tuple[pd.Series, pd.Series]:
+    # Row positions keyed by (Team, Name), fallback keyed by Name only. First row wins on duplicates.
+    pos = pd.Series(np.arange(len(all_player_data_year)))
+    by_team_name = pos.set_axis(pd.MultiIndex.from_frame(all_player_data_year[["Team", "Name"]]))
+    by_name = pos.set_axis(pd.Index(all_player_data_year["Name"]))
+    return (
+        by_team_name[~by_team_name.index.duplicated()],
+        by_name[~by_name.index.duplicated()],
+    )
+
+
+def _join_positions_pandas(
+    keys: pd.DataFrame, apd_year: pd.DataFrame, adv_keys: pd.DataFrame
+) -> Tuple[np.ndarray, np.ndarray]:
+    by_team_name, by_name = _build_player_lookup(apd_year)
+    meta = by_team_name.reindex(pd.MultiIndex.from_arrays([keys["_team"], keys["_name"]])).to_numpy()
+    meta = np.where(np.isnan(meta), by_name.reindex(keys["_name"]).to_numpy(), meta)
+
+    # (gameIdx, home, Starters) -> advanced row, built once per year; first occurrence wins.
+    by_adv_key = pd.Series(np.arange(len(adv_keys)), index=pd.MultiIndex.from_frame(adv_keys))
+    by_adv_key = by_adv_key[~by_adv_key.index.duplicated()]
+    adv = by_adv_key.reindex(pd.MultiIndex.from_frame(keys[ADV_KEYS])).to_numpy()
+    return np.nan_to_num(meta, nan=-1).astype(np.int64), np.nan_to_num(adv, nan=-1).astype(np.int64)
+
+
+def _join_positions_polars(
+    keys: pd.DataFrame, apd_year: pd.DataFrame, adv_keys: pd.DataFrame
+) -> Tuple[np.ndarray, np.ndarray]:
+    import polars as pl
+
+    left = pl.from_pandas(keys).with_row_index("_row")
+    apd = pl.from_pandas(apd_year[["Team", "Name"]]).with_row_index("_meta")
+    by_team_name = apd.unique(["Team", "Name"], keep="first", maintain_order=True)
+    by_name = apd.unique("Name", keep="first", maintain_order=True).select(
+        "Name", pl.col("_meta").alias("_meta_name")
+    )
+    adv = pl.from_pandas(adv_keys).with_row_index("_adv").unique(ADV_KEYS, keep="first", maintain_order=True)
+
+    out = (
+        left.join(by_team_name, left_on=["_team", "_name"], right_on=["Team", "Name"], how="left")
+        .join(by_name, left_on="_name", right_on="Name", how="left")
+        .join(adv, on=ADV_KEYS, how="left")
+        .sort("_row")
+    )
+    meta = out.select(pl.coalesce("_meta", "_meta_name").cast(pl.Int64).fill_null(-1)).to_series()
+    adv_pos = out["_adv"].cast(pl.Int64).fill_null(-1)
+    return meta.to_numpy(), adv_pos.to_numpy()
+
+
+def _join_positions_modin(
+    keys: pd.DataFrame, apd_year: pd.DataFrame, adv_keys: pd.DataFrame
+) -> Tuple[np.ndarray, np.ndarray]:
+    import modin.pandas as mpd
+
+    apd = apd_year[["Team", "Name"]].rename(columns={"Team": "_team", "Name": "_name"})
+    apd = apd.assign(_meta=np.arange(len(apd)))
+    by_team_name = mpd.DataFrame(apd.drop_duplicates(["_team", "_name"]))
+    by_name = mpd.DataFrame(apd.drop_duplicates("_name")[["_name", "_meta"]].rename(columns={"_meta": "_meta_name"}))
+    adv = mpd.DataFrame(adv_keys.assign(_adv=np.arange(len(adv_keys))).drop_duplicates(ADV_KEYS))
+
+    out = (
+        mpd.DataFrame(keys.assign(_row=np.arange(len(keys))))
+        .merge(by_team_name, how="left", on=["_team", "_name"])
+        .merge(by_name, how="left", on="_name")
+        .merge(adv, how="left", on=ADV_KEYS)
+        .sort_values("_row")
+        .modin.to_pandas()
+    )
+    meta = out["_meta"].fillna(out["_meta_name"]).fillna(-1)
+    return meta.to_numpy(np.int64), out["_adv"].fillna(-1).to_numpy(np.int64)
+
+
+_JOINS = {"pandas": _join_positions_pandas, "polars": _join_positions_polars, "modin": _join_positions_modin}
+BACKENDS = tuple(_JOINS)
+
+
+def _limit_polars_threads(n_threads: int) -> None:
+    """Pool initializer: split the cores between worker processes instead of giving each a full pool."""
+    os.environ.setdefault("POLARS_MAX_THREADS", str(n_threads))
+
+
+def _build_master_for_year(
+    year: int, year_df: pd.DataFrame, apd_year: pd.DataFrame, out_path: Path, backend: str = "pandas"
+) -> int:
+    """Build and write one season's master table. Runs in a worker process; returns row count.
+
+    Conceptually: player box-score rows LEFT JOIN player metadata on (Team, Name) (falling back to
+    Name only) LEFT JOIN advanced stats on (gameIdx, home, Starters), done as hash joins over one
+    long frame per year rather than per player per game. The joins only resolve row positions
+    (on the selected backend); the wide value columns are gathered with pandas afterwards.
+    """
+    logger.info("Building master for %d", year)
+
+    basic, adv = _long_box_scores(year_df)
+    if basic.empty:
+        write_frame(pd.DataFrame(), out_path)
+        return 0
+
+    apd_year = apd_year.reset_index(drop=True)
+    keys = pd.DataFrame({
+        "_team": basic["_team"],
+        "_name": basic["Starters"].replace(_NAME_FIXES),
+        "gameIdx": basic["gameIdx"],
+        "home": basic["home"],
+        "Starters": basic["Starters"],
+    })
+    meta_pos, adv_pos = _JOINS[backend](keys, apd_year, adv[ADV_KEYS])
+
+    # Player metadata: exact (Team, Name) match first, then Name only.
+    missing = meta_pos < 0
+    if missing.any():
+        i = int(np.flatnonzero(missing)[0])
+        raise KeyError(
+            f"Could not match player info for name={keys['_name'].iloc[i]} year={year} team={keys['_team'].iloc[i]}"
+        )
+    info = apd_year.take(meta_pos).reset_index(drop=True)
+
+    # Advanced stats: first row per (game, side, Starters), same as the old per-player mask lookup.
+    adv_cols = list(adv.columns[2:].drop(["gameIdx", "home"]))
+    advanced = adv[adv_cols].reindex(adv_pos).reset_index(drop=True)
+    n_unmatched = int((adv_pos < 0).sum())
+    if n_unmatched:
+        logger.warning("%d: %d player rows without advanced stats", year, n_unmatched)
+
+    # Roster (playerIndex list) per game side, for the team/opponent columns.
+    player_idx = info["playerIndex"]
+    rosters = player_idx.groupby([basic["gameIdx"], basic["home"]], sort=False).agg(list).to_dict()
+    sides = list(zip(basic["gameIdx"], basic["home"]))
+    ids = pd.DataFrame({
+        "gameIdx": basic["gameIdx"],
+        "playerIdx": player_idx,
+        "home": basic["home"],
+        "team": [rosters.get((g, h), []) for g, h in sides],
+        "opponent": [rosters.get((g, not h), []) for g, h in sides],
+    })
+
+    basic_cols = [c for c in basic.columns[1:] if c not in ("gameIdx", "home", "_team")]
+    master = pd.concat([ids, info, basic[basic_cols], advanced], axis=1)
+    logger.info("...%d: %d games, %d player rows", year, len(year_df), len(master))
+
+    # Historical scrapes left some numeric columns as a mix of strings and floats; Parquet needs
+    # one type per column (weighted_stats coerces these the same way). Force float so they get
+    # the same dtype as the other stat columns whether or not a season has missing values.
+    for col in ("FT", "3P%"):
+        if col in master:
+            master[col] = pd.to_numeric(master[col], errors="coerce").astype(np.float64)
+
+    # Box-score magnitudes fit comfortably in float32; halves the size of every stat column.
+    stat_cols = [c for c in basic_cols + adv_cols if master[c].dtype == np.float64]
+    master[stat_cols] = master[stat_cols].astype(np.float32)
+    master = master.astype({c: "category" for c in MASTER_CATEGORY_COLS if c in master})
+
+    write_frame(master, out_path)
+    return len(master)
+
 
 def build_master_by_year(
     all_years_pkl: str | Path,
     player_data_pkl: str | Path,
     out_dir: str | Path,
     overwrite: bool = False,
+    workers: int | None = None,
+    backend: str = "pandas",
 ) -> None:
     """Build per-year master tables from boxscores + player metadata.
 
+    Seasons are built in parallel (see run_per_season for `workers`).
+    `backend="polars"` or `"modin"` runs the per-year joins on that engine (optional dependencies).
+    Modin already spreads each join over the whole machine, so it always builds seasons serially;
+    with polars each worker process gets an equal share of the cores.
+
     Inputs:
       - all_years_pkl: combined boxscore dataframe (see combine_boxscores)
       - player_data_pkl: player metadata (height, position, etc.)
 
     Outputs:
-      - {out_dir}/{YEAR}_master.pkl
+      - {out_dir}/{YEAR}_master.parquet
     """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}; expected one of {BACKENDS}")
+
     all_years_pkl = Path(all_years_pkl)
     player_data_pkl = Path(player_data_pkl)
     out_dir = Path(out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
 
     logger.info("Loading boxscores: %s", all_years_pkl)
-    df = pd.read_pickle(all_years_pkl)
+    df = _compact_boxscores(read_frame(all_years_pkl))
 
     logger.info("Loading player metadata: %s", player_data_pkl)
-    all_player_data = pd.read_pickle(player_data_pkl)
+    all_player_data = read_frame(player_data_pkl)
 
     years = sorted(df.Season.unique())
     logger.info("Found %d seasons: %s", len(years), [int(y) for y in years])
 
+    # Slice per season up front so each worker only receives (and unpickles) its own year.
+    jobs = []
     for year in years:
         year_int = int(year)
-        out_path = out_dir / f"{year_int}_master.pkl"
+        out_path = out_dir / f"{year_int}_master.parquet"
 
         if out_path.exists() and not overwrite:
             logger.info("Skipping existing: %s", out_path)
             continue
 
-        logger.info("Building master for %d", year_int)
-
         # Slice year boxscores
         year_df = df[df.Season == year]
 
@@ -147,35 +306,16 @@ def build_master_by_year(
         if apd_year.empty:
             logger.warning("No player metadata found for year=%s (float=%s)", year, float(year))
 
-        by_team_name, by_name = _build_player_lookup(apd_year)
-
-        # Build players-in-game (home/away) for each row in the year df.
-        # NOTE: This assumes _players_in_game(row, by_team_name, by_name) exists.
-        all_players_in_game = year_df.apply(
-            lambda r: _players_in_game(r, by_team_name, by_name),
-            axis=1,
-        )
-
-        master_rows = []
-        n_games = len(all_players_in_game)
-
-        for game_idx, game_player_list in enumerate(all_players_in_game):
-            home_df, away_df = game_player_list[0], game_player_list[1]
-
-            # Small speed tweak: compute these once per game, not per player row.
-            # (Requires _build_row to accept precomputed lists OR you keep your current _build_row.)
-            # If you keep your current _build_row signature, ignore this comment.
-
-            master_rows.append(
-                home_df.apply(lambda x: _build_row(game_idx, x, game_player_list, True), axis=1)
-            )
-            master_rows.append(
-                away_df.apply(lambda x: _build_row(game_idx, x, game_player_list, False), axis=1)
-            )
+        jobs.append((year_int, year_df, apd_year, out_path, backend))
 
-            if game_idx % 100 == 0:
-                logger.info("...game %d / %d", game_idx, n_games)
+    pool_kwargs = {}
+    if backend == "modin":
+        if workers not in (None, 1):
+            logger.warning("backend=modin parallelizes each join itself; ignoring workers=%d", workers)
+        workers = 1
+    elif backend == "polars" and jobs:
+        n_procs = min(workers or os.cpu_count() or 1, len(jobs))
+        pool_kwargs = {"initializer": _limit_polars_threads, "initargs": (max(1, (os.cpu_count() or 1) // n_procs),)}
 
-        master = pd.concat(master_rows, ignore_index=True)
-        master.to_pickle(out_path)
-        logger.info("Wrote: %s (rows=%d)", out_path, len(master))
+    for job, n_rows in run_per_season(_build_master_for_year, jobs, workers, **pool_kwargs):
+        logger.info("Wrote: %s (rows=%d)", job[3], n_rows)
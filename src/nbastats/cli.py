@@ -6,7 +6,7 @@ from pathlib import Path
 
 from .logging_config import setup_logging
 from .scrape import scrape_boxscores
-from .build_master import combine_boxscores, build_master_by_year
+from .build_master import BACKENDS, combine_boxscores, build_master_by_year
 from .weighted_stats import build_weighted_stats_by_year
 from .training_set import build_training_set
 from .modeling import train_baseline_classifier
@@ -27,7 +27,9 @@ def build_parser() -> argparse.ArgumentParser:
     s.add_argument("--start-year", type=int, default=1992)
     s.add_argument("--end-year", type=int, default=2022)
     s.add_argument("--delay", type=float, default=0.5, help="Delay between requests (seconds)")
+    s.add_argument("--max-concurrency", type=int, default=4, help="Max boxscore pages in flight")
     s.add_argument("--overwrite", action="store_true")
+    s.add_argument("--no-cache", action="store_true", help="Don't read/write the on-disk HTML cache")
 
     c = sub.add_parser("combine-boxscores", help="Combine year pickles into one AllYears.pkl")
     c.add_argument("--boxscores-dir", default="data/boxscores")
@@ -38,6 +40,8 @@ def build_parser() -> argparse.ArgumentParser:
     m.add_argument("--player-data", default="data/playerData.pkl")
     m.add_argument("--out-dir", default="data/master_by_year")
     m.add_argument("--overwrite", action="store_true")
+    m.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    m.add_argument("--backend", choices=BACKENDS, default="pandas", help="DataFrame engine for the joins")
 
     w = sub.add_parser("weighted-stats", help="Build per-year game-level weighted stats from master tables")
     w.add_argument("--master-dir", default="data/master_by_year")
@@ -45,16 +49,20 @@ def build_parser() -> argparse.ArgumentParser:
     w.add_argument("--start-year", type=int, default=2008)
     w.add_argument("--end-year", type=int, default=2019)
     w.add_argument("--overwrite", action="store_true")
+    w.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
 
-    t = sub.add_parser("make-training", help="Build trainingData.pkl from weighted stats")
+    t = sub.add_parser("make-training", help="Build trainingData.parquet from weighted stats")
     t.add_argument("--weighted-dir", default="data/weighted_stats_by_year")
-    t.add_argument("--out", default="data/trainingData.pkl")
+    t.add_argument(
+        "--out", default="data/trainingData.parquet", help="Output dataset directory (must end in .parquet)"
+    )
     t.add_argument("--start-year", type=int, default=1992)
     t.add_argument("--end-year", type=int, default=2019)
     t.add_argument("--min-history", type=int, default=20, help="Min games history per team")
+    t.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
 
-    b = sub.add_parser("train-baseline", help="Train a baseline classifier on trainingData.pkl")
-    b.add_argument("--training", default="data/trainingData.pkl")
+    b = sub.add_parser("train-baseline", help="Train a baseline classifier on trainingData.parquet")
+    b.add_argument("--training", default="data/trainingData.parquet")
     b.add_argument("--out-dir", default="outputs")
     b.add_argument("--test-frac", type=float, default=0.2)
     b.add_argument("--seed", type=int, default=0)
@@ -74,18 +82,37 @@ def main(argv=None) -> int:
             end_year=args.end_year,
             request_delay_s=args.delay,
             overwrite=args.overwrite,
+            max_concurrency=args.max_concurrency,
+            use_cache=not args.no_cache,
         )
     elif args.cmd == "combine-boxscores":
         combine_boxscores(args.boxscores_dir, args.out)
     elif args.cmd == "build-master":
-        build_master_by_year(args.all_years, args.player_data, args.out_dir, overwrite=args.overwrite)
+        build_master_by_year(
+            args.all_years,
+            args.player_data,
+            args.out_dir,
+            overwrite=args.overwrite,
+            workers=args.workers,
+            backend=args.backend,
+        )
     elif args.cmd == "weighted-stats":
         build_weighted_stats_by_year(
-            args.master_dir, args.out_dir, start_year=args.start_year, end_year=args.end_year, overwrite=args.overwrite
+            args.master_dir,
+            args.out_dir,
+            start_year=args.start_year,
+            end_year=args.end_year,
+            overwrite=args.overwrite,
+            workers=args.workers,
         )
     elif args.cmd == "make-training":
         build_training_set(
-            args.weighted_dir, args.out, start_year=args.start_year, end_year=args.end_year, min_games_history=args.min_history
+            args.weighted_dir,
+            args.out,
+            start_year=args.start_year,
+            end_year=args.end_year,
+            min_games_history=args.min_history,
+            workers=args.workers,
         )
     elif args.cmd == "train-baseline":
         train_baseline_classifier(args.training, out_dir=args.out_dir, test_frac=args.test_frac, random_seed=args.seed)
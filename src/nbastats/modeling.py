@@ -7,6 +7,8 @@ from typing import Dict, Tuple
 import numpy as np
 import pandas as pd
 
+from .storage import find_artifact, read_frame
+
 logger = logging.getLogger("nbastats")
 
 
@@ -32,24 +34,29 @@ def train_baseline_classifier(
     out_dir = Path(out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    df = pd.read_pickle(training_pkl)
+    df = read_frame(find_artifact(training_pkl))
 
     y = (df["score_diff"] > 0).astype(int)
     # Keep only numeric features
     X = df.drop(columns=["score_diff", "awayTeam", "homeTeam", "gameIdx", "year"], errors="ignore")
     X = X.select_dtypes(include=[np.number])
+    # float32 halves the working set; the imputer/scaler below then transform it in place.
+    X = X.astype(np.float32, copy=False)
 
     X_train, X_test, y_train, y_test = train_test_split(
         X, y, test_size=test_frac, random_state=random_seed, stratify=y
     )
 
     model = Pipeline(steps=[
-        ("imputer", SimpleImputer(strategy="median")),
-        ("scaler", StandardScaler(with_mean=True, with_std=True)),
+        ("imputer", SimpleImputer(strategy="median", copy=False)),
+        ("scaler", StandardScaler(with_mean=True, with_std=True, copy=False)),
         ("clf", LogisticRegression(max_iter=2000))
     ])
 
     model.fit(X_train, y_train)
+    # In-place transforms are only safe on our own training split; copy again for inference so
+    # predict()/predict_proba() (and later users of the saved model) never mutate their inputs.
+    model.set_params(imputer__copy=True, scaler__copy=True)
 
     y_pred = model.predict(X_test)
     y_prob = model.predict_proba(X_test)[:, 1]
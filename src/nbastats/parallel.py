@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Iterator, Optional, Sequence, Tuple
+
+
+def run_per_season(
+    fn: Callable[..., Any],
+    jobs: Sequence[tuple],
+    workers: int | None = None,
+    initializer: Optional[Callable[..., None]] = None,
+    initargs: tuple = (),
+) -> Iterator[Tuple[tuple, Any]]:
+    """Run fn(*job) for every job, yielding (job, result) pairs as they finish.
+
+    Seasons are independent, so each job runs in its own worker process; `workers` caps the pool
+    (None means os.cpu_count()). With one worker, or at most one job, everything runs serially
+    in-process, which also keeps tracebacks and debuggers simple. `initializer(*initargs)` runs
+    once in each worker process.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 1:
+        raise ValueError(f"workers must be at least 1, got {workers}")
+
+    if workers == 1 or len(jobs) <= 1:
+        for job in jobs:
+            yield job, fn(*job)
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(jobs)), initializer=initializer, initargs=initargs
+    ) as ex:
+        futures = {ex.submit(fn, *job): job for job in jobs}
+        for fut in as_completed(futures):
+            yield futures[fut], fut.result()
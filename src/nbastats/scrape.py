@@ -1,115 +1,202 @@
 from __future__ import annotations
 
+import io
 import logging
+import os
+import shutil
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List
 
+import lxml.html
 import numpy as np
 import pandas as pd
 
-from .br_utils import get_soup, get_dates_of_games
+from .br_utils import _TEAM_RE, fetch_html, get_dates_of_games, is_cached, parse_soup, set_cache_dir
+from .storage import find_artifact, read_frame
 
 logger = logging.getLogger("nbastats")
 
+HTML_PREFIX = "https://www.basketball-reference.com/boxscores/"
+BOXSCORE_COLUMNS = [
+    "Season","Month","Day","Home","Away",
+    "Home_Basic","Home_Advanced","Away_Basic","Away_Advanced"
+]
 
-def _convert_mp_to_seconds(mp: str) -> float:
-    try:
-        mins, secs = map(int, mp.split(":"))
-        return float(mins * 60 + secs)
-    except Exception:
-        return 0.0
-
-
-def _convert_basic_row(row: pd.Series) -> pd.Series:
-    row = row.copy()
-    row["MP"] = _convert_mp_to_seconds(str(row.get("MP", "0:0")))
-    for col in ["FG","FGA","FG%","3P","3PA","FTA","FT%","ORB","DRB","TRB","AST","STL","BLK","TOV","PF","PTS"]:
-        if col in row:
-            try:
-                row[col] = float(row[col])
-            except Exception:
-                row[col] = np.nan
-    # 'FT' can be a string sometimes
-    if "FT" in row:
-        try:
-            row["FT"] = float(row["FT"])
-        except Exception:
-            row["FT"] = np.nan
-    return row
-
-
-def _convert_adv_row(row: pd.Series) -> pd.Series:
-    row = row.copy()
-    row["MP"] = _convert_mp_to_seconds(str(row.get("MP", "0:0")))
-    for col in ["TS%","eFG%","3PAr","FTr","ORB%","DRB%","TRB%","AST%","STL%","BLK%","TOV%","USG%","ORtg","DRtg"]:
-        if col in row:
-            try:
-                row[col] = float(row[col])
-            except Exception:
-                row[col] = np.nan
-    return row
+
+class _RateLimiter:
+    """Space out request starts by at least `interval_s` seconds across all worker threads.
+
+    Concurrency hides network latency; this keeps the overall request rate polite regardless of
+    how many requests are in flight.
+    """
+
+    def __init__(self, interval_s: float) -> None:
+        self.interval_s = float(interval_s)
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval_s
+        if start > now:
+            time.sleep(start - now)
+
+
+BASIC_NUMERIC_COLS = ["FG","FGA","FG%","3P","3PA","FT","FTA","FT%","ORB","DRB","TRB","AST","STL","BLK","TOV","PF","PTS"]
+ADV_NUMERIC_COLS = ["TS%","eFG%","3PAr","FTr","ORB%","DRB%","TRB%","AST%","STL%","BLK%","TOV%","USG%","ORtg","DRtg"]
+
+
+def _convert_mp_to_seconds(mp: pd.Series) -> pd.Series:
+    """'MM:SS' -> seconds as float; anything else (e.g. 'Did Not Play') -> 0.0."""
+    parts = mp.astype(str).str.extract(r"^\s*(\d+):(\d+)\s*$").astype(float)
+    return (parts[0] * 60 + parts[1]).fillna(0.0)
 
 
 def _edit_table(table: pd.DataFrame, idx: int) -> pd.DataFrame:
-    """Drop subtotal rows and coerce types."""
+    """Drop subtotal rows and coerce types (column-at-a-time, no per-row Python)."""
     basic = (idx % 2) == 0
     length = 20 if basic else 16
 
     # Remove "Reserves" header row (typically row 5) and "Team Totals" last row.
     table_edit = pd.concat([table.iloc[:5, :length], table.iloc[6:-1, :length]], axis=0)
 
-    if basic:
-        table_edit = table_edit.apply(_convert_basic_row, axis=1)
-    else:
-        table_edit = table_edit.apply(_convert_adv_row, axis=1)
+    table_edit["MP"] = _convert_mp_to_seconds(table_edit["MP"]) if "MP" in table_edit else 0.0
+    numeric_cols = [c for c in (BASIC_NUMERIC_COLS if basic else ADV_NUMERIC_COLS) if c in table_edit]
+    table_edit[numeric_cols] = table_edit[numeric_cols].apply(pd.to_numeric, errors="coerce").astype(float)
     return table_edit
 
 
 def _get_team_names_from_links(links: List[str]) -> List[str]:
     teams: List[str] = []
     for link in links:
-        parts = link[1:].split("/")
-        if parts and parts[0] == "teams" and len(parts) > 2:
-            teams.append(parts[1])
-        if len(teams) == 2:
-            break
+        m = _TEAM_RE.match(link)
+        if m:
+            teams.append(m.group(1))
+            if len(teams) == 2:
+                break
     return teams
 
 
+def _read_boxscore_tables(html: bytes) -> List[pd.DataFrame]:
+    """Parse only the four tables we keep (home/away basic + advanced) out of the page.
+
+    Boxscore pages carry many more tables (per-quarter/half splits); locating <table> nodes is cheap,
+    converting them to DataFrames is not, so only the selected nodes go through pd.read_html.
+    """
+    nodes = lxml.html.fromstring(html).xpath("//table")
+    idx = [0, int(len(nodes)/2 - 1), int(len(nodes)/2), -1]
+    return [
+        pd.read_html(io.StringIO(lxml.html.tostring(nodes[i], encoding="unicode")), header=1)[0]
+        for i in idx
+    ]
+
+
+def _scrape_game(game: str, year: float, month: str, limiter: _RateLimiter) -> pd.Series:
+    """Fetch and parse a single boxscore page into one row of the year table."""
+    game_url = f"{HTML_PREFIX}{game}.html"
+    tmp = pd.Series(index=BOXSCORE_COLUMNS, dtype=object)
+    tmp["Season"] = int(year)
+    tmp["Month"] = month
+    tmp["Day"] = str(game)[6:8]
+    try:
+        # Download once; both the tables and the team links come from the same bytes.
+        if not is_cached(game_url):
+            limiter.wait()
+        html = fetch_html(game_url)
+        tables = _read_boxscore_tables(html)
+        _, links = parse_soup(html)
+        teams = _get_team_names_from_links(links)
+        logger.info("%s %s %s | home=%s away=%s", year, month, str(game)[6:8], teams[1], teams[0])
+        tables = [_edit_table(t, i) for i, t in enumerate(tables)]
+
+        tmp["Home"] = teams[1]
+        tmp["Away"] = teams[0]
+        tmp["Home_Basic"] = tables[0]
+        tmp["Home_Advanced"] = tables[1]
+        tmp["Away_Basic"] = tables[2]
+        tmp["Away_Advanced"] = tables[3]
+    except Exception as e:
+        logger.warning("Failed scrape for %s: %s", game_url, e)
+        tmp["Home"] = str(game_url)[-8:-5]
+        tmp["Away"] = np.nan
+        tmp["Home_Basic"] = np.nan
+        tmp["Home_Advanced"] = np.nan
+        tmp["Away_Basic"] = np.nan
+        tmp["Away_Advanced"] = np.nan
+    return tmp
+
+
+def _scrape_to_checkpoint(
+    game: str, year: float, month: str, limiter: _RateLimiter, partial_dir: Path
+) -> pd.Series | None:
+    """Scrape one game and checkpoint it to {partial_dir}/{game}.pkl.
+
+    Writing each game as soon as it is parsed lets an interrupted year resume from its checkpoints.
+    Failed games are returned (they are tiny) instead of checkpointed, so a run that is interrupted
+    retries them. Once a year completes, its pickle keeps the failure placeholders and later runs
+    skip the year unless --overwrite is given.
+    """
+    row = _scrape_game(game, year, month, limiter)
+    row.name = str(game)
+    if pd.isna(row["Away"]):
+        return row
+    path = partial_dir / f"{game}.pkl"
+    tmp = path.with_suffix(".tmp")
+    row.to_pickle(tmp)
+    os.replace(tmp, path)
+    return None
+
+
 def scrape_boxscores(
     data_dir: str | Path = "data",
     start_year: int = 1992,
     end_year: int = 2022,
     request_delay_s: float = 6,
     overwrite: bool = False,
+    max_concurrency: int = 4,
+    use_cache: bool = True,
 ) -> None:
     """Scrape Basketball Reference boxscores into year-level pickles.
 
     Outputs:
-      - {data_dir}/boxscores/{YEAR}.pkl
+      - {data_dir}/gamesByYear.parquet (only if no games index exists yet)
+      - {data_dir}/boxscores/{YEAR}.pkl (pickle: cells hold nested DataFrames)
+
+    Each parsed game is checkpointed under {data_dir}/boxscores/_partial/{YEAR}/ while the year is
+    in progress; an interrupted run picks up from there. This is for resuming only: the year is
+    still reassembled from all of its checkpoints at the end, so peak memory is the same as holding
+    the whole year. The directory is removed once the year pickle is written.
+
+    Games are fetched by up to `max_concurrency` worker threads sharing one connection pool.
+    Request starts are still spaced by `request_delay_s` across all workers, so concurrency only
+    overlaps network latency and never raises the request rate.
+
+    With `use_cache`, raw pages are kept under {data_dir}/_html_cache so reruns (e.g. with
+    --overwrite) parse from disk without touching the network or the rate limiter.
 
     Note: This is a lightweight scraper for personal/research use. Please be respectful
     of rate limits; adjust request_delay_s if needed.
     """
     data_dir = Path(data_dir)
-    games_path = data_dir / "gamesByYear.pkl"
+    games_path = find_artifact(data_dir / "gamesByYear.parquet")
     boxscores_dir = data_dir / "boxscores"
     boxscores_dir.mkdir(parents=True, exist_ok=True)
+    set_cache_dir(data_dir / "_html_cache" if use_cache else None)
 
     if games_path.exists():
-        games_by_year = pd.read_pickle(games_path)
+        games_by_year = read_frame(games_path)
         logger.info("Loaded games index: %s", games_path)
     else:
         logger.info("No games index found; scraping schedules to build it.")
+        games_path = data_dir / "gamesByYear.parquet"
         games_by_year = get_dates_of_games(games_path,start_year,end_year,request_delay_s)
 
-    html_prefix = "https://www.basketball-reference.com/boxscores/"
-
-    df_format = pd.DataFrame(columns=[
-        "Season","Month","Day","Home","Away",
-        "Home_Basic","Home_Advanced","Away_Basic","Away_Advanced"
-    ])
+    limiter = _RateLimiter(request_delay_s)
 
     years = [y for y in sorted(games_by_year["Year"].unique()) if start_year <= int(y) <= end_year]
     for year in years:
@@ -119,45 +206,30 @@ def scrape_boxscores(
             continue
 
         group = games_by_year[games_by_year["Year"] == year]
-        rows = []
-        for _, row in group.iterrows():
-            for game in row["Games"]:
-                game_url = f"{html_prefix}{game}.html"
-                try:
-                    tables = pd.read_html(game_url, header=1)
-                    idx = [0, int(len(tables)/2 - 1), int(len(tables)/2), -1]
-                    tables = [tables[i] for i in idx]
-                    _, links = get_soup(game_url)
-                    teams = _get_team_names_from_links(links)
-                    logger.info("%s %s %s | home=%s away=%s", row["Year"], row["Month"], str(game)[6:8], teams[1], teams[0])
-                    tables = [_edit_table(t, i) for i, t in enumerate(tables[:4])]
-
-                    tmp = pd.Series(index=df_format.columns, dtype=object)
-                    tmp["Season"] = int(row["Year"])
-                    tmp["Month"] = row["Month"]
-                    tmp["Day"] = str(game)[6:8]
-                    tmp["Home"] = teams[1]
-                    tmp["Away"] = teams[0]
-                    tmp["Home_Basic"] = tables[0]
-                    tmp["Home_Advanced"] = tables[1]
-                    tmp["Away_Basic"] = tables[2]
-                    tmp["Away_Advanced"] = tables[3]
-                except Exception as e:
-                    logger.warning("Failed scrape for %s: %s", game_url, e)
-                    tmp = pd.Series(index=df_format.columns, dtype=object)
-                    tmp["Season"] = int(row["Year"])
-                    tmp["Month"] = row["Month"]
-                    tmp["Day"] = str(game)[6:8]
-                    tmp["Home"] = str(game_url)[-8:-5]
-                    tmp["Away"] = np.nan
-                    tmp["Home_Basic"] = np.nan
-                    tmp["Home_Advanced"] = np.nan
-                    tmp["Away_Basic"] = np.nan
-                    tmp["Away_Advanced"] = np.nan
-
-                rows.append(tmp)
-                time.sleep(request_delay_s)
-
-        master = pd.DataFrame(rows, columns=df_format.columns)
+        jobs = [(game, row["Year"], row["Month"]) for _, row in group.iterrows() for game in row["Games"]]
+
+        partial_dir = boxscores_dir / "_partial" / str(int(year))
+        partial_dir.mkdir(parents=True, exist_ok=True)
+        done = {p.stem for p in partial_dir.glob("*.pkl")}
+        if done:
+            logger.info("Resuming %d: %d/%d games already checkpointed", int(year), len(done), len(jobs))
+        todo = [job for job in jobs if str(job[0]) not in done]
+
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as ex:
+            failed = {
+                str(row.name): row
+                for row in ex.map(lambda job: _scrape_to_checkpoint(*job, limiter, partial_dir), todo)
+                if row is not None
+            }
+
+        # Assemble in schedule order from the checkpoints (plus the failed placeholders).
+        rows = [
+            failed[str(game)] if str(game) in failed else pd.read_pickle(partial_dir / f"{game}.pkl")
+            for game, _, _ in jobs
+        ]
+        master = pd.DataFrame(rows, columns=BOXSCORE_COLUMNS).reset_index(drop=True)
         master.to_pickle(out_pkl)
-        logger.info("Wrote: %s (%d games)", out_pkl, len(master))
+        logger.info("Wrote: %s (%d games, %d failed)", out_pkl, len(master), len(failed))
+        shutil.rmtree(partial_dir)
+        if not any(partial_dir.parent.iterdir()):
+            partial_dir.parent.rmdir()
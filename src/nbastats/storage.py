@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pandas as pd
+
+PARQUET_COMPRESSION = "zstd"
+
+
+def _arrow_safe(df: pd.DataFrame) -> pd.DataFrame:
+    """Cast mixed str/non-str object columns to str so pyarrow can infer one type per column.
+
+    Scraped metadata mixes types within a column (e.g. Experience is "R" for rookies, an int
+    otherwise). List-valued columns (team/opponent ids) are left alone.
+    """
+    out = df
+    for col in df.columns[df.dtypes == object]:
+        kinds = {type(v) for v in df[col].dropna()}
+        if str in kinds and len(kinds) > 1:
+            if out is df:
+                out = df.copy()
+            out[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return out
+
+
+def read_frame(path: str | Path) -> pd.DataFrame:
+    """Load a pipeline artifact; the format is picked from the file suffix.
+
+    A directory is read as a partitioned Parquet dataset (see write_partition) into one frame.
+    """
+    path = Path(path)
+    if path.is_dir():
+        df = pd.read_parquet(path, engine="pyarrow")
+        # Partition keys come back as categoricals; restore plain columns.
+        for key in {p.name.split("=", 1)[0] for p in path.iterdir() if "=" in p.name}:
+            df[key] = df[key].astype(df[key].cat.categories.dtype)
+        return df
+    if path.suffix == ".parquet":
+        return pd.read_parquet(path, engine="pyarrow")
+    return pd.read_pickle(path)
+
+
+def write_frame(df: pd.DataFrame, path: str | Path) -> Path:
+    """Write a pipeline artifact; the format is picked from the file suffix.
+
+    Flat tables go to Parquet (columnar, zstd-compressed, much faster to read back). Frames
+    holding nested DataFrames per cell (raw boxscores) can't be expressed in Arrow and stay pickle.
+    """
+    path = Path(path)
+    if path.suffix == ".parquet":
+        _arrow_safe(df).to_parquet(path, engine="pyarrow", compression=PARQUET_COMPRESSION)
+    else:
+        df.to_pickle(path)
+    return path
+
+
+def write_partition(df: pd.DataFrame, dataset_dir: str | Path, key: str, value: object) -> Path:
+    """Write one hive-style partition, {dataset_dir}/{key}={value}/part.parquet, of a Parquet dataset.
+
+    The key column is dropped from the file; readers recover it from the directory name.
+    """
+    path = Path(dataset_dir) / f"{key}={value}" / "part.parquet"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return write_frame(df.drop(columns=[key], errors="ignore"), path)
+
+
+def find_artifact(path: str | Path) -> Path:
+    """Resolve an artifact path, preferring exactly what was given.
+
+    Returns `path` if it exists, else its `.parquet` sibling if present, else the legacy `.pkl`
+    sibling (which may not exist).
+    """
+    path = Path(path)
+    if path.exists():
+        return path
+    parquet = path.with_suffix(".parquet")
+    return parquet if parquet.exists() else path.with_suffix(".pkl")
@@ -1,13 +1,140 @@
 from __future__ import annotations
 
 import logging
+import os
+import shutil
+import tempfile
 from pathlib import Path
+from typing import List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
 
+from .parallel import run_per_season
+from .storage import find_artifact, read_frame, write_partition
+
 logger = logging.getLogger("nbastats")
 
+# Not features: the label source, identifiers and the side flag.
+DROP_COLS = ["PTS", "awayTeam", "gameIdx", "home", "homeTeam"]
+
+
+def _team_positions(
+    home_codes: np.ndarray, away_codes: np.ndarray, is_home: np.ndarray, n_teams: int
+) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+    """Row positions per team code in file order: the team's own stat rows, and every row of its games.
+
+    Both lists get one extra, empty entry at the end so a missing team (code -1) has no history.
+    """
+    own_codes = np.where(is_home, home_codes, away_codes)
+    own = [np.flatnonzero(own_codes == t) for t in range(n_teams)]
+    involved = [np.flatnonzero((home_codes == t) | (away_codes == t)) for t in range(n_teams)]
+    empty = np.empty(0, dtype=np.int64)
+    return own + [empty], involved + [empty]
+
+
+# Per team: its stat-row positions, plus prefix sums of those rows and of their non-NaN counts.
+_Prefix = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+def _team_prefix_sums(stats: np.ndarray, own: List[np.ndarray]) -> List[_Prefix]:
+    """Cumulative (NaN-skipping) stat sums per team, so any window of its games is two lookups."""
+    prefix = []
+    for rows in own:
+        team_stats = stats[rows]
+        valid = ~np.isnan(team_stats)
+        csum = np.zeros((len(rows) + 1, stats.shape[1]))
+        ccnt = np.zeros((len(rows) + 1, stats.shape[1]))
+        np.cumsum(np.where(valid, team_stats, 0.0), axis=0, dtype=np.float64, out=csum[1:])
+        np.cumsum(valid, axis=0, dtype=np.float64, out=ccnt[1:])
+        prefix.append((rows, csum, ccnt))
+    return prefix
+
+
+def _mean_last(prefix: _Prefix, end: int, n: int) -> np.ndarray:
+    """NaN-skipping column means over the team's last `n` rows before position `end`."""
+    rows, csum, ccnt = prefix
+    stop = int(np.searchsorted(rows, end))
+    lo = max(0, stop - n)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (csum[stop] - csum[lo]) / (ccnt[stop] - ccnt[lo])
+
+
+def _training_rows_for_year(year: int, in_path: Path, min_games_history: int) -> Optional[pd.DataFrame]:
+    """Training rows for one season (None if no game qualifies). Runs in a worker process."""
+    logger.info("Building training rows for %d from %s", year, in_path.name)
+    # Positions define "games to date", so they must follow file (chronological) order.
+    df = read_frame(in_path).reset_index(drop=True)
+    # One shared category set for both team columns (legacy pickles hold plain strings).
+    teams = sorted(set(df["homeTeam"].dropna()) | set(df["awayTeam"].dropna()))
+    for c in ("homeTeam", "awayTeam"):
+        df[c] = pd.Categorical(df[c], categories=teams)
+    feat_cols = [c for c in df.columns if c not in DROP_COLS and pd.api.types.is_numeric_dtype(df[c])]
+    # float32 storage; window sums accumulate in float64 (see _team_prefix_sums).
+    stats = df[feat_cols].to_numpy(dtype=np.float32)
+
+    # First home/away row of every game that has both sides.
+    is_home = df["home"].to_numpy(dtype=bool)
+    pos = pd.Series(np.arange(len(df)))
+    home_pos = pos[is_home].groupby(df["gameIdx"][is_home]).first()
+    away_pos = pos[~is_home].groupby(df["gameIdx"][~is_home]).first()
+    game_ids = home_pos.index.intersection(away_pos.index).sort_values()
+
+    home_codes = df["homeTeam"].cat.codes.to_numpy()
+    away_codes = df["awayTeam"].cat.codes.to_numpy()
+    own, involved = _team_positions(home_codes, away_codes, is_home, len(teams))
+    prefix = _team_prefix_sums(stats, own)
+    pts = df["PTS"].to_numpy(dtype=np.float64)
+
+    n = len(game_ids)
+    feats = np.empty((n, len(feat_cols)), dtype=np.float32)
+    score_diff = np.empty(n)
+    away_out = np.empty(n, dtype=home_codes.dtype)
+    home_out = np.empty(n, dtype=home_codes.dtype)
+    game_out = np.empty(n, dtype=np.int64)
+    k = 0
+    for game_idx, hi, ai in zip(game_ids, home_pos[game_ids], away_pos[game_ids]):
+        home_team, away_team = home_codes[hi], away_codes[ai]
+        min_index = min(hi, ai)
+
+        # Every game contributes one row per side, so rows / 2 is games played to date.
+        if np.searchsorted(involved[home_team], min_index) / 2.0 < min_games_history:
+            continue
+
+        feats[k] = (
+            _mean_last(prefix[home_team], min_index, min_games_history)
+            - _mean_last(prefix[away_team], min_index, min_games_history)
+        )
+        score_diff[k] = pts[hi] - pts[ai]
+        away_out[k], home_out[k], game_out[k] = away_team, home_team, game_idx
+        k += 1
+
+    if k == 0:
+        return None
+    columns = dict(zip(feat_cols, feats[:k].T))
+    columns.update(
+        score_diff=score_diff[:k],
+        awayTeam=pd.Categorical.from_codes(away_out[:k], categories=teams),
+        homeTeam=pd.Categorical.from_codes(home_out[:k], categories=teams),
+        gameIdx=game_out[:k],
+        year=np.full(k, year, dtype=np.int64),
+    )
+    return pd.DataFrame(columns)
+
+
+def _write_training_year(year: int, in_path: Path, min_games_history: int, out_dir: Path) -> int:
+    """Build one season's rows and write them as its partition; returns the row count."""
+    rows = _training_rows_for_year(year, in_path, min_games_history)
+    if rows is None:
+        return 0
+    write_partition(rows, out_dir, "year", year)
+    return len(rows)
+
+
+def _is_training_dataset(path: Path) -> bool:
+    """True if `path` is a directory holding only year=* partitions (what build_training_set writes)."""
+    return path.is_dir() and all(p.is_dir() and p.name.startswith("year=") for p in path.iterdir())
+
 
 def build_training_set(
     weighted_stats_dir: str | Path,
@@ -15,81 +142,70 @@ def build_training_set(
     start_year: int = 1992,
     end_year: int = 2019,
     min_games_history: int = 20,
+    workers: int | None = None,
 ) -> Path:
     """Build an ML-ready training dataset from per-game weighted stats.
 
     For each game, we compute features based on the *previous* N games (default 20) for
     each team and store the feature difference (home - away). Label is score differential.
+    Seasons are processed in parallel (see run_per_season for `workers`) and each one writes
+    its own partition, so no process ever holds more than one season of rows.
 
     Outputs:
-      - out_path (pickle)
+      - out_path/year={YEAR}/part.parquet (a partitioned Parquet dataset; storage.read_frame
+        or pd.read_parquet(out_path) reads it back as one frame, seasons in order)
+
+    `out_path` must end in .parquet. The dataset is built in a temporary sibling directory and
+    only moved into place once every season succeeded; an existing `out_path` is replaced only if
+    it is a previous dataset (nothing but year=* partitions), otherwise this raises.
     """
     weighted_stats_dir = Path(weighted_stats_dir)
     out_path = Path(out_path)
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-
-    rows = []
+    if out_path.suffix != ".parquet":
+        raise ValueError(
+            f"Training set is written as a partitioned Parquet dataset; out_path must end in .parquet "
+            f"(got {out_path})"
+        )
+    if out_path.exists() and not _is_training_dataset(out_path):
+        raise FileExistsError(
+            f"Refusing to replace {out_path}: it is not a training dataset written by make-training"
+        )
+
+    jobs = []
     for year in range(start_year, end_year + 1):
-        # Backwards compatibility: accept either *_sumStatsByGame.pkl or *_weightedStatsByGame.pkl
+        # Backwards compatibility: accept *_sumStatsByGame.pkl or *_weightedStatsByGame.{parquet,pkl}
         p1 = weighted_stats_dir / f"{year}_sumStatsByGame.pkl"
-        p2 = weighted_stats_dir / f"{year}_weightedStatsByGame.pkl"
-        in_pkl = p1 if p1.exists() else p2
-        if not in_pkl.exists():
-            logger.warning("Missing weighted stats: %s", in_pkl)
+        wanted = weighted_stats_dir / f"{year}_weightedStatsByGame.parquet"
+        p2 = find_artifact(wanted)
+        in_path = p1 if p1.exists() else p2
+        if not in_path.exists():
+            logger.warning("Missing weighted stats: %s (or legacy %s, %s)", wanted, p2.name, p1.name)
             continue
 
-        logger.info("Building training rows for %d from %s", year, in_pkl.name)
-        df = pd.read_pickle(in_pkl)
-        games = df.groupby("gameIdx")
-
-        for game_idx, game in games:
-            home = game[game["home"] == True]
-            away = game[game["home"] == False]
-            if home.empty or away.empty:
-                continue
-
-            # Use index ordering to define "games to date" consistently
-            home_index = home.index[0]
-            away_index = away.index[0]
-            home_team = home["homeTeam"].unique()[0]
-            away_team = away["awayTeam"].unique()[0]
-
-            home_games = df[(df["homeTeam"] == home_team) | (df["awayTeam"] == home_team)]
-            away_games = df[(df["homeTeam"] == away_team) | (df["awayTeam"] == away_team)]
-
-            min_index = min(home_index, away_index)
-            home_to_date = home_games.loc[:min_index - 1, :]
-            away_to_date = away_games.loc[:min_index - 1, :]
-
-            num_home_games = len(home_to_date) / 2.0
-            if num_home_games < min_games_history:
-                continue
-
-            # Select last N games for each team (as home or away)
-            home_last = home_to_date[
-                ((home_to_date["homeTeam"] == home_team) & (home_to_date["home"] == True)) |
-                ((home_to_date["awayTeam"] == home_team) & (home_to_date["home"] == False))
-            ].tail(min_games_history)
-
-            away_last = away_to_date[
-                ((away_to_date["homeTeam"] == away_team) & (away_to_date["home"] == True)) |
-                ((away_to_date["awayTeam"] == away_team) & (away_to_date["home"] == False))
-            ].tail(min_games_history)
-
-            drop_cols = ["PTS", "awayTeam", "gameIdx", "home", "homeTeam"]
-            home_stats = home_last.drop(columns=[c for c in drop_cols if c in home_last.columns]).mean(numeric_only=True)
-            away_stats = away_last.drop(columns=[c for c in drop_cols if c in away_last.columns]).mean(numeric_only=True)
-
-            game_data = (home_stats - away_stats)
-            game_data["score_diff"] = float(home["PTS"].values[0] - away["PTS"].values[0])
-            game_data["awayTeam"] = away_team
-            game_data["homeTeam"] = home_team
-            game_data["gameIdx"] = int(game_idx)
-            game_data["year"] = int(year)
-
-            rows.append(game_data)
-
-    training_df = pd.DataFrame(rows)
-    training_df.to_pickle(out_path)
-    logger.info("Wrote training set: %s (rows=%d, cols=%d)", out_path, len(training_df), training_df.shape[1])
+        jobs.append((year, in_path, min_games_history))
+
+    # Build next to out_path (same filesystem, so the final rename is atomic). mkdtemp only makes
+    # the private staging area; the dataset directory inside it gets normal permissions.
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(prefix=f".{out_path.name}.", dir=out_path.parent))
+    new_dir = staging / "new"
+    old_dir = staging / "old"
+    try:
+        new_dir.mkdir()
+        jobs = [job + (new_dir,) for job in jobs]
+        n_rows = sum(rows for _, rows in run_per_season(_write_training_year, jobs, workers))
+
+        # Swap the finished dataset in; the previous one (checked above) is moved aside first
+        # because a directory can't be renamed over a non-empty one.
+        if out_path.exists():
+            os.replace(out_path, old_dir)
+        os.replace(new_dir, out_path)
+    except BaseException:
+        if old_dir.exists() and not out_path.exists():
+            os.replace(old_dir, out_path)
+        raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    logger.info("Wrote training set: %s (rows=%d, seasons=%d)", out_path, n_rows, len(jobs))
     return out_path
@@ -1,74 +1,179 @@
 from __future__ import annotations
 
+import functools
 import logging
 from pathlib import Path
+from typing import Callable, Optional, Tuple
 
 import numpy as np
 import pandas as pd
 
-logger = logging.getLogger("nbastats")
-
-STAT_COLS = [
-    "MP","FG","FGA","FG%","3P","3PA","FT","FTA","FT%","ORB","DRB","TRB","AST","STL","BLK","TOV","PF","PTS",
-    "TS%","eFG%","3PAr","FTr","ORB%","DRB%","TRB%","AST%","STL%","BLK%","TOV%","USG%","ORtg","DRtg"
-]
-
-
-def _team_stats(stats: pd.DataFrame) -> pd.Series:
-    """Compute weighted team metrics for a team within a single game."""
-    team_stats = pd.Series(dtype=float)
-
-    # Protect against empty stats (rare scrape failures)
-    if stats.empty:
-        return team_stats
-
-    team_stats["eFG%"] = (stats["FG"].sum() + stats["3P"].sum()/2.0) / max(stats["FGA"].sum(), 1.0)
-    team_stats["DRtg"] = np.nansum(stats["DRtg"] * stats["MP"] / 2880.0) / 5.0
-    team_stats["ORtg"] = np.nansum(stats["ORtg"] * stats["MP"] / 2880.0) / 5.0
-    team_stats["TOV%"] = np.nansum(stats["TOV%"] * stats["MP"] / 2880.0) / 5.0
-
-    team_stats["BLK%"] = np.nansum(stats["BLK%"] * stats["MP"] / 2880.0)
-    team_stats["ORB%"] = np.nansum(stats["ORB%"] * stats["MP"] / 2880.0)
-    team_stats["DRB%"] = np.nansum(stats["DRB%"] * stats["MP"] / 2880.0)
-    team_stats["TRB%"] = np.nansum(stats["TRB%"] * stats["MP"] / 2880.0)
-    team_stats["AST%"] = np.nansum(stats["AST%"] * stats["MP"] / 2880.0)
-    team_stats["STL%"] = np.nansum(stats["STL%"] * stats["MP"] / 2880.0)
+from .parallel import run_per_season
+from .storage import find_artifact, read_frame, write_frame
 
-    team_stats["FTr"] = stats["FTA"].sum() / max(stats["FGA"].sum(), 1.0)
-    team_stats["3PAr"] = stats["3PA"].sum() / max(stats["FGA"].sum(), 1.0)
-    team_stats["TS%"] = stats["PTS"].sum() / max(2.0 * (stats["FGA"].sum() + 0.44 * stats["FTA"].sum()), 1.0)
-
-    # Free Throws can be strings in historical data; coerce carefully.
-    ft = pd.to_numeric(stats["FT"], errors="coerce").fillna(0).sum()
-    fta = pd.to_numeric(stats["FTA"], errors="coerce").fillna(0).sum()
-    team_stats["FT%"] = ft / fta if fta else np.nan
+logger = logging.getLogger("nbastats")
 
-    team_stats["PTS"] = stats["PTS"].sum()
-    return team_stats
+# Minute-weighted (MP / 48 min) player rates summed into team rates, in output order.
+WEIGHTED_COLS = ["DRtg","ORtg","TOV%","BLK%","ORB%","DRB%","TRB%","AST%","STL%"]
+# Ratings are per-possession numbers shared by the five players on court, so their sum is averaged.
+_PER_FIVE_COLS = {"DRtg","ORtg","TOV%"}
+_SUM_COLS = ["FG","3P","FGA","3PA","FT","FTA","PTS"]
+# Column layout of the per-team-game sums matrix fed to _team_stats.
+_IN_COLS = _SUM_COLS + WEIGHTED_COLS
+_IN = {c: i for i, c in enumerate(_IN_COLS)}
+
+METRIC_COLS = ["eFG%"] + WEIGHTED_COLS + ["FTr","3PAr","TS%","FT%","PTS"]
+_OUT = {c: j for j, c in enumerate(METRIC_COLS)}
+OUTPUT_COLS = METRIC_COLS + ["gameIdx","homeTeam","awayTeam","home"]
+
+
+def _group_layout(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """Row order grouping each (gameIdx, home) side contiguously, and the segment starts.
+
+    Games ascend, home side first; the sort is stable so rows keep file order within a side.
+    `starts` has one extra trailing entry (the row count) so segment g is starts[g]:starts[g+1].
+    """
+    game_idx = df["gameIdx"].to_numpy()
+    home = df["home"].to_numpy(dtype=bool)
+    order = np.lexsort((~home, game_idx))
+    gi, h = game_idx[order], home[order]
+    change = np.ones(len(order), dtype=bool)
+    change[1:] = (gi[1:] != gi[:-1]) | (h[1:] != h[:-1])
+    return order, np.append(np.flatnonzero(change), len(order))
+
+
+def _complete_games(df: pd.DataFrame) -> np.ndarray:
+    """Row mask for games that have both a home and an away side."""
+    game_idx = df["gameIdx"].to_numpy()
+    home = df["home"].to_numpy(dtype=bool)
+    return np.isin(game_idx, game_idx[home]) & np.isin(game_idx, game_idx[~home])
+
+
+def _game_values(df: pd.DataFrame, order: np.ndarray) -> np.ndarray:
+    """Per-player inputs laid out as _IN_COLS (MP-weighted where needed), rows in `order`.
+
+    Stored as float32 (box-score values need nothing wider, and it halves what the segment pass
+    reads); the segment sums accumulate in float64.
+    """
+    w = df["MP"].to_numpy(dtype=np.float64) / 2880.0
+    n_sum = len(_SUM_COLS)
+    values = np.empty((len(df), len(_IN_COLS)), dtype=np.float32)
+    # Free Throws can be strings in historical data; unparseable values become NaN, which the
+    # segment sums skip (same as counting them as 0).
+    values[:, :n_sum] = df[_SUM_COLS].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+    values[:, n_sum:] = df[WEIGHTED_COLS].to_numpy(dtype=np.float64) * w[:, None]
+    return values[order]
+
+
+def _segment_sums_py(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """NaN-skipping column sums of each row segment (numba kernel source; see _segment_sums)."""
+    n_seg = starts.shape[0] - 1
+    n_col = values.shape[1]
+    sums = np.zeros((n_seg, n_col))
+    for g in range(n_seg):
+        for r in range(starts[g], starts[g + 1]):
+            for k in range(n_col):
+                x = values[r, k]
+                if not np.isnan(x):
+                    sums[g, k] += x
+    return sums
+
+
+_SEGMENT_SUMS_SIG = "float64[:, ::1](float32[:, ::1], int64[::1])"
+
+
+@functools.lru_cache(maxsize=None)
+def _segment_sums_kernel() -> Optional[Callable[[np.ndarray, np.ndarray], np.ndarray]]:
+    """Compile _segment_sums_py with numba once per process; None if numba isn't installed."""
+    try:
+        from numba import njit
+    except ImportError:
+        logger.debug("numba not installed; weighted stats use the NumPy reduceat path")
+        return None
+    # nopython + nogil: the kernel touches only arrays, so it can run alongside other threads.
+    # No parallel=True: seasons already run in separate processes and a season's sums take well
+    # under a millisecond, so threads inside the kernel would only add compile time.
+    # One eager signature (C-contiguous float32 values, int64 starts): a single specialization is
+    # compiled, or loaded from the on-disk cache, here rather than on the first call.
+    return njit(_SEGMENT_SUMS_SIG, cache=True, nogil=True)(_segment_sums_py)
+
+
+def _segment_sums(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    kernel = _segment_sums_kernel()
+    if kernel is not None:
+        values = np.ascontiguousarray(values, dtype=np.float32)
+        return kernel(values, np.ascontiguousarray(starts, dtype=np.int64))
+    if len(starts) < 2:
+        return np.zeros((0, values.shape[1]))
+    return np.add.reduceat(np.nan_to_num(values, nan=0.0), starts[:-1], axis=0, dtype=np.float64)
+
+
+def _team_stats(sums: np.ndarray, out: np.ndarray) -> None:
+    """Fill `out` (team-games x METRIC_COLS) from per-team-game sums laid out as _IN_COLS."""
+    fg, fg3, fga, fg3a, ft, fta, pts = (sums[:, _IN[c]] for c in _SUM_COLS)
+    fga_floor = np.maximum(fga, 1.0)
+
+    out[:, _OUT["eFG%"]] = (fg + fg3 / 2.0) / fga_floor
+    for c in WEIGHTED_COLS:
+        out[:, _OUT[c]] = sums[:, _IN[c]] / 5.0 if c in _PER_FIVE_COLS else sums[:, _IN[c]]
+    out[:, _OUT["FTr"]] = fta / fga_floor
+    out[:, _OUT["3PAr"]] = fg3a / fga_floor
+    out[:, _OUT["TS%"]] = pts / np.maximum(2.0 * (fga + 0.44 * fta), 1.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out[:, _OUT["FT%"]] = np.where(fta != 0, ft / fta, np.nan)
+    out[:, _OUT["PTS"]] = pts
+
+
+def _weighted_game_stats(df: pd.DataFrame) -> pd.DataFrame:
+    """Home/away weighted team metrics for every game in `df` (two rows per game, home first)."""
+    # Filter one-sided games (scrape gaps) up front so every game yields exactly two rows.
+    complete = _complete_games(df)
+    if not complete.all():
+        logger.warning(
+            "Skipping %d game(s) missing a home or away side", df["gameIdx"][~complete].nunique()
+        )
+        df = df[complete]
+
+    order, starts = _group_layout(df)
+    sums = _segment_sums(_game_values(df, order), starts)
+    out = np.empty((len(sums), len(METRIC_COLS)), dtype=np.float32)
+    _team_stats(sums, out)
+
+    first = order[starts[:-1]]
+    game_idx = df["gameIdx"].to_numpy()[first]
+    home = df["home"].to_numpy(dtype=bool)[first]
+    # Team is categorical in Parquet masters (a no-op cast); legacy pickles get encoded here.
+    teams = df["Team"].astype("category")
+    team = teams.cat.codes.to_numpy()[first]
+
+    # A game's sides are adjacent segments, so a running count of game changes numbers the games.
+    new_game = np.ones(len(first), dtype=bool)
+    new_game[1:] = game_idx[1:] != game_idx[:-1]
+    game_no = np.cumsum(new_game) - 1
+    home_team = np.full(int(new_game.sum()), -1, dtype=team.dtype)
+    away_team = home_team.copy()
+    home_team[game_no[home]] = team[home]
+    away_team[game_no[~home]] = team[~home]
+
+    columns = dict(zip(METRIC_COLS, out.T))
+    columns["gameIdx"] = game_idx.astype(np.float64)
+    columns["homeTeam"] = pd.Categorical.from_codes(home_team[game_no], categories=teams.cat.categories)
+    columns["awayTeam"] = pd.Categorical.from_codes(away_team[game_no], categories=teams.cat.categories)
+    columns["home"] = home
+    return pd.DataFrame(columns, columns=OUTPUT_COLS)
 
 
 def game_stats_sum(df_game: pd.DataFrame) -> pd.DataFrame:
     """Compute home/away aggregated stats for a single game."""
-    home = df_game[df_game["home"] == True][STAT_COLS]
-    away = df_game[df_game["home"] == False][STAT_COLS]
-
-    home_team = df_game[df_game["home"] == True]["Team"].unique()[0]
-    away_team = df_game[df_game["home"] == False]["Team"].unique()[0]
-    game_idx = int(df_game["gameIdx"].unique()[0])
-
-    home_stats = _team_stats(home)
-    home_stats["gameIdx"] = game_idx
-    home_stats["homeTeam"] = home_team
-    home_stats["awayTeam"] = away_team
-    home_stats["home"] = True
+    return _weighted_game_stats(df_game)
 
-    away_stats = _team_stats(away)
-    away_stats["gameIdx"] = game_idx
-    away_stats["homeTeam"] = home_team
-    away_stats["awayTeam"] = away_team
-    away_stats["home"] = False
 
-    return pd.DataFrame([home_stats, away_stats])
+def _build_weighted_stats_for_year(year: int, in_path: Path, out_path: Path) -> int:
+    """Build and write one season's weighted stats; returns the row count. Runs in a worker process."""
+    logger.info("Building weighted stats for %d", year)
+    game_sum_stats = _weighted_game_stats(read_frame(in_path))
+    write_frame(game_sum_stats, out_path)
+    return len(game_sum_stats)
 
 
 def build_weighted_stats_by_year(
@@ -77,30 +182,33 @@ def build_weighted_stats_by_year(
     start_year: int = 2008,
     end_year: int = 2019,
     overwrite: bool = False,
+    workers: int | None = None,
 ) -> None:
-    """Build per-year game-level weighted stats from master tables."""
+    """Build per-year game-level weighted stats from master tables.
+
+    Outputs:
+      - {out_dir}/{YEAR}_weightedStatsByGame.parquet
+
+    Seasons are built in parallel (see run_per_season for `workers`).
+    """
     master_by_year_dir = Path(master_by_year_dir)
     out_dir = Path(out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
 
+    jobs = []
     for year in range(start_year, end_year + 1):
-        in_pkl = master_by_year_dir / f"{year}_master.pkl"
+        wanted = master_by_year_dir / f"{year}_master.parquet"
+        in_pkl = find_artifact(wanted)
         if not in_pkl.exists():
-            logger.warning("Missing master file: %s", in_pkl)
+            logger.warning("Missing master file: %s (or legacy %s)", wanted, in_pkl.name)
             continue
 
-        out_pkl = out_dir / f"{year}_weightedStatsByGame.pkl"
-        if out_pkl.exists() and not overwrite:
-            logger.info("Skipping existing: %s", out_pkl)
+        out_path = out_dir / f"{year}_weightedStatsByGame.parquet"
+        if out_path.exists() and not overwrite:
+            logger.info("Skipping existing: %s", out_path)
             continue
 
-        logger.info("Building weighted stats for %d", year)
-        df = pd.read_pickle(in_pkl)
-
-        rows = []
-        for game_idx in sorted(df["gameIdx"].unique()):
-            rows.append(game_stats_sum(df[df["gameIdx"] == game_idx]))
+        jobs.append((year, in_pkl, out_path))
 
-        game_sum_stats = pd.concat(rows, ignore_index=True)
-        game_sum_stats.to_pickle(out_pkl)
-        logger.info("Wrote: %s (rows=%d)", out_pkl, len(game_sum_stats))
+    for job, n_rows in run_per_season(_build_weighted_stats_for_year, jobs, workers):
+        logger.info("Wrote: %s (rows=%d)", job[2], n_rows)